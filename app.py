@@ -1,45 +1,248 @@
+import asyncio
+import bisect
+import functools
+import gzip
+import hashlib
 import io
+import json
+import math
+import multiprocessing
 import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fractions import Fraction
+from typing import NamedTuple
+from urllib.parse import urlparse
+import av
 import ffmpeg
-from flask import Flask, request, Response, jsonify, send_file
+import orjson
+from av.codec.hwaccel import HWAccel
+from PIL import Image, features
+from flask import Flask, request, Response, jsonify, render_template, send_file
 import yt_dlp
 
 
 app = Flask(__name__)
 
 VIDEO_PATH = 'static/video.mp4'
+# Folder of the videos downloaded from YouTube, as cached_{video_id}.mp4.
+VIDEO_CACHE_DIR = 'static/cache'
+# Storyboard sprite layout: STORYBOARD_COLUMNS x STORYBOARD_ROWS tiles,
+# each STORYBOARD_TILE_WIDTH pixels wide, evenly spread over the video.
+STORYBOARD_COLUMNS = 10
+STORYBOARD_ROWS = 10
+STORYBOARD_TILE_WIDTH = 160
+# Number of videos kept open (demuxer and decoder) to extract thumbnails.
+THUMBNAIL_CONTAINERS = 16
+# Hardware device used to decode videos for thumbnails and storyboards, e.g.
+# 'cuda', 'vaapi' or 'videotoolbox'. Decoding is done on the CPU when unset
+# or when the device cannot be used.
+THUMB_HWACCEL = os.getenv('THUMB_HWACCEL')
+# Number of processes decoding and encoding thumbnails, so that this CPU-bound
+# work does not block the gevent workers. 0 renders thumbnails in the request thread.
+THUMBNAIL_RENDER_PROCESSES = int(os.getenv('THUMBNAIL_RENDER_PROCESSES', '0'))
+# Rendered thumbnails are cached as
+# THUMBNAIL_CACHE_DIR/v{METADATA_VERSION}/{video_id}/{video_version}/{timestamp}.{extension},
+# the least recently used ones being removed above THUMBNAIL_CACHE_MAX_FILES
+# by a sweep running at most every THUMBNAIL_CACHE_SWEEP_INTERVAL seconds.
+THUMBNAIL_CACHE_DIR = 'static/cache/thumbs'
+THUMBNAIL_CACHE_MAX_FILES = 10000
+THUMBNAIL_CACHE_SWEEP_INTERVAL = 300
+# Value of the 'timestamp' parameter of /thumbnail asking for a representative
+# frame, used when no timestamp has been chosen yet.
+REPRESENTATIVE_TIMESTAMP = 'random'
+# Thumbnails are downscaled to fit in a THUMBNAIL_MAX_SIZE pixels square
+# before being encoded: a preview does not need the full video resolution.
+THUMBNAIL_MAX_SIZE = 640
+# Thumbnails of a given keyframe never change, let browsers keep them.
+THUMBNAIL_MAX_AGE = 31536000
+# Vendored static assets are versioned by folder, so their content never changes.
+VENDOR_STATIC_MAX_AGE = 31536000
+# Size of the chunks read from disk when streaming a video.
+VIDEO_CHUNK_SIZE = 64 * 1024
+# First range of a Range header: 'start-end', 'start-' or '-suffix_length'.
+BYTE_RANGE_PATTERN = re.compile(r'(\d*)-(\d*)')
+# Number of videos downloaded in parallel in the background.
+DOWNLOAD_WORKERS = 4
+# Status of the background downloads, as {task_id}.json files shared by all the
+# gunicorn workers, removed DOWNLOAD_TASK_RETENTION seconds after the download
+# finished. The file of a running download is touched every
+# DOWNLOAD_TASK_HEARTBEAT seconds: once it has not been for
+# DOWNLOAD_TASK_STALE seconds, the worker running it is considered dead.
+DOWNLOAD_TASKS_DIR = f'{VIDEO_CACHE_DIR}/tasks'
+DOWNLOAD_TASK_RETENTION = 3600
+DOWNLOAD_TASK_HEARTBEAT = 30
+DOWNLOAD_TASK_STALE = 3 * DOWNLOAD_TASK_HEARTBEAT
+TASK_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+# Maximum number of URLs accepted by /set_video/batch.
+DOWNLOAD_BATCH_MAX_URLS = 20
+YDL_OPTS = {
+    'format': 'bestvideo+bestaudio/best',  # dynamically select best available streams
+    'merge_output_format': 'mp4',           # merge into mp4 format
+    'outtmpl': f'{VIDEO_CACHE_DIR}/cached_%(id)s.%(ext)s',
+    'noplaylist': True,                     # a playlist URL only downloads its video
+    'concurrent_fragment_downloads': 8,     # fetch HLS/DASH fragments in parallel
+    'http_chunk_size': 10 * 1024 * 1024,    # download in 10 MiB chunks to avoid throttling
+    'socket_timeout': 10,                   # fail fast on unresponsive hosts
+    'retries': 2,
+}
+# Accepted video_id values, as they end up in file paths.
+VIDEO_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,32}')
+# Hosts accepted in YouTube URLs, others are rejected before reaching yt-dlp.
+YOUTUBE_HOSTS = {'youtube.com', 'www.youtube.com', 'm.youtube.com', 'youtu.be'}
+YOUTUBE_URL_MAX_LENGTH = 2048
+# When set (e.g. '/internal_video/'), /video delegates the file transfer to
+# the nginx internal location with that prefix, aliased to the static/ folder.
+VIDEO_ACCEL_REDIRECT = os.getenv('VIDEO_ACCEL_REDIRECT')
 
 class ProbeError(Exception):
     pass
 
 
+class DownloadError(Exception):
+    pass
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class ThumbnailFormat(NamedTuple):
+    mimetype: str
+    extension: str
+    pil_format: str
+    save_options: dict
+
+
+# Thumbnail formats by order of preference, the last one being the fallback for
+# clients which do not explicitly accept the others. Lossy formats are plenty
+# for a preview: WebP and AVIF are several times smaller than JPEG, itself far
+# smaller than PNG. AVIF is encoded at a high speed, as the default one takes
+# several times longer than decoding the frame.
+THUMBNAIL_FORMATS = [
+    thumbnail_format for thumbnail_format in (
+        ThumbnailFormat('image/avif', 'avif', 'AVIF', {'quality': 60, 'speed': 8}),
+        ThumbnailFormat('image/webp', 'webp', 'WEBP', {'quality': 75}),
+        ThumbnailFormat('image/jpeg', 'jpg', 'JPEG', {'quality': 80}),
+    )
+    # Only keep the formats Pillow has been built with.
+    if features.check(thumbnail_format.extension)
+]
+
+
+def is_valid_video_id(video_id: str) -> bool:
+    """
+    Returns whether the video_id is safe to use in a file path.
+    """
+    return VIDEO_ID_PATTERN.fullmatch(video_id) is not None
+
+
+def is_valid_youtube_url(youtube_url: str) -> bool:
+    """
+    Returns whether the URL is an http(s) URL on one of YOUTUBE_HOSTS.
+    """
+    if not isinstance(youtube_url, str) or len(youtube_url) > YOUTUBE_URL_MAX_LENGTH:
+        return False
+    try:
+        parsed_url = urlparse(youtube_url)
+    except ValueError:
+        return False
+    return parsed_url.scheme in ('http', 'https') and parsed_url.hostname in YOUTUBE_HOSTS
+
+
 def get_video_path(video_id: str = None) -> str | None:
     """
     Returns the file path of the video to use.
     If video_id is provided, it returns 'static/cached_{video_id}.mp4'
-    if that file exists; otherwise, returns None.
+    if that file exists; otherwise (or if video_id is invalid), returns None.
     If no video_id is provided, returns the default video path.
     """
     if not video_id:
         return VIDEO_PATH
-    
-    path = f"static/cache/cached_{video_id}.mp4"
+    if not is_valid_video_id(video_id):
+        return None
+
+    path = f"{VIDEO_CACHE_DIR}/cached_{video_id}.mp4"
+    if video_id in _get_cached_video_ids():
+        return path
+    # The directory mtime has a coarse granularity: a video renamed into it
+    # right after it was listed may not have changed it. Misses are rare, so
+    # check the file itself and remember it.
     if os.path.exists(path):
+        _add_cached_video_id(video_id)
         return path
-    else:
-        return None
+    return None
 
-def get_video_metadata(video_path: str) -> dict:
+
+# video_ids of the videos in VIDEO_CACHE_DIR, with the directory mtime they
+# were listed at. Adding or removing a video changes the directory mtime.
+_cached_video_ids: tuple[int | None, frozenset[str]] = (None, frozenset())
+
+
+def _get_cached_video_ids() -> frozenset[str]:
+    """
+    Returns the video_ids of the cached videos, only listing VIDEO_CACHE_DIR
+    again when its mtime changed, so that most lookups cost a single stat.
+    """
+    global _cached_video_ids
+    try:
+        mtime_ns = os.stat(VIDEO_CACHE_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return frozenset()
+    listed_mtime_ns, video_ids = _cached_video_ids
+    if mtime_ns != listed_mtime_ns:
+        with os.scandir(VIDEO_CACHE_DIR) as entries:
+            video_ids = frozenset(
+                entry.name[len('cached_'):-len('.mp4')]
+                for entry in entries
+                if entry.name.startswith('cached_') and entry.name.endswith('.mp4')
+                and entry.is_file()
+            )
+        _cached_video_ids = (mtime_ns, video_ids)
+    return video_ids
+
+
+def _add_cached_video_id(video_id: str):
     """
-    Retrieves metadata from the video using ffmpeg.probe.
+    Adds a cached video missed by the last listing of VIDEO_CACHE_DIR.
+    """
+    global _cached_video_ids
+    listed_mtime_ns, video_ids = _cached_video_ids
+    _cached_video_ids = (listed_mtime_ns, video_ids | {video_id})
+
+
+# ffprobe is resolved once, and called directly rather than through ffmpeg.probe.
+# Besides the streams and format, the keyframes of the video stream are listed
+# from the packet flags, without decoding the video.
+FFPROBE_ARGS = [
+    shutil.which('ffprobe') or 'ffprobe', '-v', 'error', '-print_format', 'json',
+    '-show_streams', '-show_format',
+    '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+]
+
+
+def _parse_probe(probe: dict) -> dict:
+    """
+    Extracts the video metadata from the ffprobe JSON output.
     Returns a dictionary containing:
       - codec
       - width
       - height
       - duration (in seconds)
       - framerate (in images per second)
+      - keyframes (timestamps in seconds of the video keyframes, sorted)
     """
-    probe = ffmpeg.probe(video_path)
     video_stream = next(
         (stream for stream in probe['streams'] if stream['codec_type'] == 'video'),
         None
@@ -50,25 +253,521 @@ def get_video_metadata(video_path: str) -> dict:
     width = int(video_stream.get('width', 0))
     height = int(video_stream.get('height', 0))
     duration = float(probe['format']['duration'])
-    # r_frame_rate is usually a string like "25/1". Compute the fps.
-    r_frame_rate = video_stream.get('r_frame_rate', '0/0')
-    num, den = r_frame_rate.split('/')
-    framerate = float(num) / float(den) if float(den) != 0 else 0.0
+    # r_frame_rate is usually a string like "25/1" or "30000/1001".
+    try:
+        framerate = float(Fraction(video_stream.get('r_frame_rate', '0/0')))
+    except (ValueError, ZeroDivisionError):
+        framerate = 0.0
+    # Keyframe timestamps are made relative to the start of the video stream.
+    start_time = float(video_stream.get('start_time', 0))
+    keyframes = sorted(
+        float(packet['pts_time']) - start_time
+        for packet in probe.get('packets', [])
+        if 'K' in packet.get('flags', '') and 'pts_time' in packet
+    )
     return {
         'codec': codec,
         'width': width,
         'height': height,
         'duration': duration,
-        'framerate': framerate
+        'framerate': framerate,
+        'keyframes': keyframes
     }
 
 
+def probe_video_metadata(video_path: str) -> dict:
+    """
+    Retrieves metadata from the video using ffprobe (see _parse_probe).
+    Raises ProbeError if the video cannot be probed.
+    """
+    try:
+        result = subprocess.run(FFPROBE_ARGS + [video_path], capture_output=True, check=True)
+        probe = orjson.loads(result.stdout)
+    except subprocess.CalledProcessError as exc:
+        raise ProbeError(exc.stderr.decode(errors='replace').strip()) from exc
+    except (OSError, orjson.JSONDecodeError) as exc:
+        raise ProbeError(str(exc)) from exc
+    return _parse_probe(probe)
+
+
+def snap_to_keyframe(keyframes: list[float], timestamp: float) -> float:
+    """
+    Returns the keyframe timestamp nearest to the given timestamp,
+    or the timestamp itself if no keyframe is known.
+    """
+    if not keyframes:
+        return timestamp
+    index = bisect.bisect_left(keyframes, timestamp)
+    neighbours = keyframes[max(index - 1, 0):index + 1]
+    return min(neighbours, key=lambda keyframe: abs(keyframe - timestamp))
+
+
+# Version of the metadata stored in the JSON sidecars, to bump whenever
+# probe_video_metadata returns new fields, or when the way they are used
+# changes, so that older sidecars (and cached thumbnails) are ignored.
+METADATA_VERSION = 4
+
+
+def _metadata_sidecar_path(video_path: str) -> str:
+    """
+    Returns the path of the JSON file storing the metadata of a video,
+    e.g. 'static/cache/cached_{video_id}.json' for a cached video.
+    """
+    return os.path.splitext(video_path)[0] + '.json'
+
+
+def _read_metadata_sidecar(video_path: str, mtime_ns: int, size: int) -> dict | None:
+    """
+    Returns the metadata stored in the JSON sidecar of the video,
+    or None if there is no sidecar or if it describes another version of the file.
+    """
+    try:
+        with open(_metadata_sidecar_path(video_path)) as sidecar:
+            sidecar_content = json.load(sidecar)
+        if (sidecar_content['mtime_ns'] == mtime_ns and sidecar_content['size'] == size
+                and sidecar_content.get('version') == METADATA_VERSION):
+            return sidecar_content['metadata']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+# Metadata of the probed videos, by (path, mtime_ns, size), in least recently
+# used order, at most METADATA_CACHE_SIZE of them.
+METADATA_CACHE_SIZE = 128
+_metadata_cache: OrderedDict[tuple[str, int, int], dict] = OrderedDict()
+_metadata_cache_lock = threading.Lock()
+
+
+def _cache_video_metadata(key: tuple[str, int, int], meta: dict):
+    """
+    Stores the metadata of a given version of a video file in memory.
+    """
+    with _metadata_cache_lock:
+        _metadata_cache[key] = meta
+        _metadata_cache.move_to_end(key)
+        while len(_metadata_cache) > METADATA_CACHE_SIZE:
+            _metadata_cache.popitem(last=False)
+
+
+def _known_video_metadata(key: tuple[str, int, int]) -> dict | None:
+    """
+    Returns the metadata of a given version of a video file from memory, or
+    else from its JSON sidecar (then kept in memory), or None. Never runs ffprobe.
+    """
+    with _metadata_cache_lock:
+        meta = _metadata_cache.get(key)
+        if meta is not None:
+            _metadata_cache.move_to_end(key)
+            return meta
+    meta = _read_metadata_sidecar(*key)
+    if meta is not None:
+        _cache_video_metadata(key, meta)
+    return meta
+
+
+def _metadata_key(video_path: str) -> tuple[str, int, int]:
+    """
+    Returns the (path, mtime_ns, size) identifying a version of a video file.
+    """
+    stat = os.stat(video_path)
+    return video_path, stat.st_mtime_ns, stat.st_size
+
+
+def video_version(video_path: str) -> str:
+    """
+    Returns a short tag identifying the current version of a video file, from
+    its mtime and size, so that files derived from it are not reused once the
+    video is replaced.
+    """
+    _, mtime_ns, size = _metadata_key(video_path)
+    return hashlib.sha256(f'{mtime_ns}-{size}'.encode(), usedforsecurity=False).hexdigest()[:12]
+
+
+def _write_metadata_sidecar(video_path: str, mtime_ns: int, size: int, meta: dict):
+    """
+    Stores the metadata of a given version of a video file in its JSON sidecar.
+    """
+    try:
+        with open(_metadata_sidecar_path(video_path), 'w') as sidecar:
+            json.dump({'version': METADATA_VERSION, 'mtime_ns': mtime_ns, 'size': size,
+                       'metadata': meta}, sidecar)
+    except OSError:
+        # The sidecar is only an optimization, e.g. static/ may be read-only.
+        pass
+
+
+def get_video_metadata(video_path: str) -> dict:
+    """
+    Returns the metadata of the video (see probe_video_metadata).
+    Results are memoized per (path, mtime, size), in memory and in a JSON
+    sidecar, so that ffprobe only runs once per video file.
+    """
+    key = _metadata_key(video_path)
+    meta = _known_video_metadata(key)
+    if meta is None:
+        meta = probe_video_metadata(video_path)
+        _write_metadata_sidecar(*key, meta)
+        _cache_video_metadata(key, meta)
+    return dict(meta)
+
+
+async def _probe_video_metadata_async(video_path: str, semaphore: asyncio.Semaphore) -> dict:
+    """
+    Same as probe_video_metadata, without blocking the event loop.
+    """
+    async with semaphore:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *FFPROBE_ARGS, video_path,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+        except OSError as exc:
+            raise ProbeError(str(exc)) from exc
+    if process.returncode != 0:
+        raise ProbeError(stderr.decode(errors='replace').strip())
+    try:
+        return _parse_probe(orjson.loads(stdout))
+    except orjson.JSONDecodeError as exc:
+        raise ProbeError(str(exc)) from exc
+
+
+async def _probe_videos_metadata_async(video_paths: list[str]) -> list:
+    """
+    Probes the videos concurrently, at most one ffprobe per CPU at a time.
+    Returns, in the same order, the metadata or the exception of each video.
+    """
+    semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+    return await asyncio.gather(
+        *(_probe_video_metadata_async(video_path, semaphore) for video_path in video_paths),
+        return_exceptions=True
+    )
+
+
+def get_videos_metadata(video_paths: list[str]) -> dict[str, dict | Exception]:
+    """
+    Returns the metadata (see get_video_metadata), or the exception raised when
+    probing it, of each video by path. The videos which are not cached yet are
+    probed concurrently instead of one after the other.
+    """
+    keys = {video_path: _metadata_key(video_path) for video_path in video_paths}
+    results = {}
+    missing = []
+    for video_path, key in keys.items():
+        meta = _known_video_metadata(key)
+        if meta is None:
+            missing.append(video_path)
+        else:
+            results[video_path] = dict(meta)
+    if missing:
+        probed = asyncio.run(_probe_videos_metadata_async(missing))
+        for video_path, meta in zip(missing, probed):
+            if not isinstance(meta, Exception):
+                _write_metadata_sidecar(*keys[video_path], meta)
+                _cache_video_metadata(keys[video_path], meta)
+                meta = dict(meta)
+            results[video_path] = meta
+    return results
+
+
+# Open video containers used to extract thumbnails, by (path, mtime), in
+# least recently used order. Each container comes with the lock serializing
+# its use, as a container can only seek and decode for one request at a time.
+_containers: OrderedDict[tuple[str, int], tuple[av.container.InputContainer, threading.Lock]] = OrderedDict()
+_containers_lock = threading.Lock()
+
+
+def _open_video(video_path: str) -> av.container.InputContainer:
+    """
+    Opens the video, decoding on the THUMB_HWACCEL device when it is set and
+    usable. Decoded frames are downloaded to system memory either way.
+    """
+    if THUMB_HWACCEL:
+        try:
+            return av.open(video_path, hwaccel=HWAccel(THUMB_HWACCEL, allow_software_fallback=True))
+        except (ValueError, av.FFmpegError) as exc:
+            app.logger.warning('Unable to use %s hardware decoding: %s', THUMB_HWACCEL, exc)
+    return av.open(video_path)
+
+
+def _get_container(video_path: str) -> tuple[av.container.InputContainer, threading.Lock]:
+    """
+    Returns the open container of the video and its lock, opening it if needed
+    and evicting the least recently used containers above THUMBNAIL_CONTAINERS.
+    """
+    key = (video_path, os.stat(video_path).st_mtime_ns)
+    with _containers_lock:
+        entry = _containers.get(key)
+        if entry is not None:
+            _containers.move_to_end(key)
+            return entry
+
+    container = _open_video(video_path)
+    if not container.streams.video:
+        container.close()
+        raise ProbeError('No video stream found')
+    # Let the decoder use frame and slice threading.
+    container.streams.video[0].thread_type = 'AUTO'
+
+    with _containers_lock:
+        # If another request opened the video concurrently, keep its container.
+        entry = _containers.setdefault(key, (container, threading.Lock()))
+        while len(_containers) > THUMBNAIL_CONTAINERS:
+            # Evicted containers are closed when the last request using them
+            # releases them.
+            _containers.popitem(last=False)
+    return entry
+
+
+def decode_frame(video_path: str, timestamp: float) -> av.VideoFrame | None:
+    """
+    Decodes the keyframe at or before the timestamp (in seconds) in-process,
+    or returns None if the timestamp is out of the video duration bounds.
+    """
+    container, lock = _get_container(video_path)
+    with lock:
+        if container.duration is not None and timestamp > container.duration / av.time_base:
+            return None
+        stream = container.streams.video[0]
+        # Keyframe timestamps are rounded by ffprobe: truncating them could land
+        # one tick before the keyframe, hence on the previous keyframe.
+        offset = (stream.start_time or 0) + round(timestamp / stream.time_base)
+        container.seek(offset, stream=stream, any_frame=False, backward=True)
+        return next(container.decode(stream), None)
+
+
+def extract_frame(video_path: str, timestamp: float,
+                  thumbnail_format: ThumbnailFormat) -> bytes | None:
+    """
+    Returns the keyframe at or before the timestamp (see decode_frame) as an
+    image in the given format, or None if the timestamp is out of the video
+    duration bounds.
+    """
+    frame = decode_frame(video_path, timestamp)
+    if frame is None:
+        return None
+    return encode_image(frame.to_image(), thumbnail_format)
+
+
+def run_ffmpeg_decoding(build) -> bytes:
+    """
+    Runs the ffmpeg command returned by build(input_options) and returns its
+    output, decoding on the THUMB_HWACCEL device when it is set. Unlike PyAV,
+    ffmpeg fails when the device cannot be used, so the command is then run
+    again on the CPU.
+    """
+    if THUMB_HWACCEL:
+        try:
+            out, _ = build({'hwaccel': THUMB_HWACCEL}).run(capture_stdout=True, capture_stderr=True)
+            return out
+        except ffmpeg.Error as exc:
+            app.logger.warning('Unable to use %s hardware decoding: %s', THUMB_HWACCEL,
+                               exc.stderr.decode(errors='replace').strip())
+    out, _ = build({}).run(capture_stdout=True, capture_stderr=True)
+    return out
+
+
+def extract_representative_frame(video_path: str,
+                                 thumbnail_format: ThumbnailFormat) -> bytes | None:
+    """
+    Returns the most representative of the first 100 keyframes of the video
+    (ffmpeg thumbnail filter) as an image in the given format, or None if no
+    frame could be extracted. Only keyframes are decoded (-skip_frame nokey).
+    """
+    out = run_ffmpeg_decoding(
+        lambda input_options: ffmpeg
+        .input(video_path, skip_frame='nokey', **input_options)
+        .output('pipe:', vf='thumbnail', vframes=1, format='image2', vcodec='bmp')
+    )
+    if not out:
+        return None
+    # BMP is uncompressed, hence cheap to produce and to decode here.
+    return encode_image(Image.open(io.BytesIO(out)), thumbnail_format)
+
+
+def encode_image(image: Image.Image, thumbnail_format: ThumbnailFormat) -> bytes:
+    """
+    Encodes the image in the given thumbnail format, downscaled to fit in
+    THUMBNAIL_MAX_SIZE x THUMBNAIL_MAX_SIZE pixels.
+    """
+    image.thumbnail((THUMBNAIL_MAX_SIZE, THUMBNAIL_MAX_SIZE), reducing_gap=2.0)
+    buffer = io.BytesIO()
+    image.save(buffer, thumbnail_format.pil_format, **thumbnail_format.save_options)
+    return buffer.getvalue()
+
+
+def render_thumbnail(video_path: str, timestamp: float | None,
+                     thumbnail_format: ThumbnailFormat) -> bytes | None:
+    """
+    Returns the thumbnail at the timestamp (see extract_frame), or the
+    representative thumbnail if timestamp is None (see extract_representative_frame).
+    Raises ThumbnailError on decoding errors, which unlike PyAV and ffmpeg
+    errors can be sent back from a render process.
+    """
+    try:
+        if timestamp is None:
+            return extract_representative_frame(video_path, thumbnail_format)
+        return extract_frame(video_path, timestamp, thumbnail_format)
+    except (OSError, ValueError, av.FFmpegError, ffmpeg.Error) as exc:
+        raise ThumbnailError(str(exc)) from exc
+
+
+_render_executor: ProcessPoolExecutor | None = None
+_render_executor_lock = threading.Lock()
+
+
+def run_render_thumbnail(video_path: str, timestamp: float | None,
+                         thumbnail_format: ThumbnailFormat) -> bytes | None:
+    """
+    Runs render_thumbnail in one of the THUMBNAIL_RENDER_PROCESSES processes,
+    each keeping its own open containers, or in the current thread if 0.
+    """
+    global _render_executor
+    if not THUMBNAIL_RENDER_PROCESSES:
+        return render_thumbnail(video_path, timestamp, thumbnail_format)
+    with _render_executor_lock:
+        if _render_executor is None:
+            # Created in the worker process itself, and spawned rather than
+            # forked so that the render processes do not inherit gevent's hub.
+            _render_executor = ProcessPoolExecutor(
+                max_workers=THUMBNAIL_RENDER_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+    return _render_executor.submit(render_thumbnail, video_path, timestamp, thumbnail_format).result()
+
+
+def negotiate_thumbnail_format() -> ThumbnailFormat:
+    """
+    Returns the preferred thumbnail format explicitly accepted by the client
+    (its Accept header), falling back to the last of THUMBNAIL_FORMATS.
+    """
+    accepted = {mimetype for mimetype, quality in request.accept_mimetypes if quality > 0}
+    for thumbnail_format in THUMBNAIL_FORMATS[:-1]:
+        if thumbnail_format.mimetype in accepted:
+            return thumbnail_format
+    return THUMBNAIL_FORMATS[-1]
+
+
+def write_file_atomically(path: str, data: bytes):
+    """
+    Writes the file then renames it into place, so that concurrent requests
+    never read a partially written file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, path)
+
+
+def sweep_thumbnail_cache():
+    """
+    Removes the least recently used thumbnails (by access time) until the
+    cache holds at most THUMBNAIL_CACHE_MAX_FILES files.
+    """
+    entries = []
+    for root, _, files in os.walk(THUMBNAIL_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # Filesystems mounted with noatime/relatime may not update atime.
+            entries.append((max(stat.st_atime, stat.st_mtime), path))
+    if len(entries) <= THUMBNAIL_CACHE_MAX_FILES:
+        return
+    entries.sort()
+    for _, path in entries[:len(entries) - THUMBNAIL_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Runs sweep_thumbnail_cache in the background, one sweep at a time, and at
+# most once every THUMBNAIL_CACHE_SWEEP_INTERVAL seconds.
+_sweep_executor = ThreadPoolExecutor(max_workers=1)
+_last_sweep: float | None = None
+_sweep_lock = threading.Lock()
+
+
+def schedule_thumbnail_cache_sweep():
+    """
+    Schedules a sweep of the thumbnail cache, unless one has been scheduled
+    less than THUMBNAIL_CACHE_SWEEP_INTERVAL seconds ago. Walking the whole
+    cache after every new thumbnail would run almost continuously while the
+    slider is moved.
+    """
+    global _last_sweep
+    now = time.monotonic()
+    with _sweep_lock:
+        if _last_sweep is not None and now - _last_sweep < THUMBNAIL_CACHE_SWEEP_INTERVAL:
+            return
+        _last_sweep = now
+    _sweep_executor.submit(sweep_thumbnail_cache)
+
+
+def parse_byte_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a 'bytes=start-end' Range header (including the open ended
+    'bytes=start-' and suffix 'bytes=-length' forms) for a file of the given size.
+    Returns the inclusive (start, end) offsets, or None if the header must be
+    ignored (invalid syntax or unit other than bytes) and the whole file served.
+    Raises RangeNotSatisfiable if the range starts past the end of the file.
+    Only the first range of a multi-range header is honored.
+    """
+    unit, _, ranges = range_header.partition('=')
+    if unit.strip() != 'bytes':
+        return None
+    match = BYTE_RANGE_PATTERN.fullmatch(ranges.split(',')[0].strip())
+    if match is None or match.group() == '-':
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    else:
+        # Suffix range: the last N bytes of the file.
+        if int(last) == 0:
+            raise RangeNotSatisfiable()
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def stream_file(path: str, start: int, end: int):
+    """
+    Yields the bytes of the file between the inclusive start and end offsets,
+    VIDEO_CHUNK_SIZE bytes at a time.
+    """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(VIDEO_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 @app.route('/metadata')
 def metadata():
     """
-    Returns video metadata in JSON format.
+    Returns video metadata in JSON format, along with the version of the video
+    file (see video_version), to add to the thumbnail URLs as 'v' so that
+    browsers do not reuse the thumbnails of a replaced video.
+    The keyframes list is only used internally and is left out.
     """
     video_id = request.args.get("video_id", None)
+    if video_id and not is_valid_video_id(video_id):
+        return jsonify({'error': f'Invalid video_id {video_id}'}), 400
     video_path = get_video_path(video_id)
     if video_id and video_path is None:
         return jsonify({'error': f'Cached video not found for video_id {video_id}'}), 404
@@ -77,44 +776,167 @@ def metadata():
         meta = get_video_metadata(video_path)
     except ProbeError as exc:
         return jsonify({'error': 'Unable to retrieve video metadata', 'message': str(exc)}), 500
+    meta.pop('keyframes', None)
+    meta['version'] = video_version(video_path)
     return jsonify(meta)
 
 
+@app.route('/metadata/batch', methods=['POST'])
+def metadata_batch():
+    """
+    Returns the metadata of several videos in JSON format.
+    Expects a JSON payload with a 'video_ids' list, an empty video_id meaning
+    the default static video. Returns, in the same order, the metadata or the
+    error of each video. The keyframes lists are left out.
+    """
+    video_ids = request.json.get("video_ids")
+    if (not isinstance(video_ids, list) or not video_ids
+            or not all(isinstance(video_id, str) for video_id in video_ids)):
+        return jsonify({'error': 'No video_ids provided'}), 400
+
+    video_paths = {video_id: get_video_path(video_id) for video_id in video_ids}
+    metas = get_videos_metadata([path for path in video_paths.values() if path is not None])
+    videos = []
+    for video_id in video_ids:
+        video_path = video_paths[video_id]
+        if video_id and not is_valid_video_id(video_id):
+            videos.append({'video_id': video_id, 'error': f'Invalid video_id {video_id}'})
+        elif video_path is None:
+            videos.append({'video_id': video_id,
+                           'error': f'Cached video not found for video_id {video_id}'})
+        elif isinstance(metas[video_path], Exception):
+            videos.append({'video_id': video_id, 'error': 'Unable to retrieve video metadata',
+                           'message': str(metas[video_path])})
+        else:
+            meta = dict(metas[video_path])
+            meta.pop('keyframes', None)
+            meta['version'] = video_version(video_path)
+            videos.append({'video_id': video_id, **meta})
+    return jsonify({'videos': videos})
+
+
 @app.route('/thumbnail')
 def thumbnail():
     """
     Generates a thumbnail from VIDEO_PATH at a timestamp (in seconds)
-    provided via the 'timestamp' query parameter. Returns a PNG image.
+    provided via the 'timestamp' query parameter. Returns an image of the
+    keyframe nearest to the timestamp, decoded in-process with PyAV and cached
+    on disk under THUMBNAIL_CACHE_DIR. The image is AVIF, WebP or JPEG
+    depending on the Accept header.
+    With 'timestamp=random', returns the most representative keyframe of the
+    beginning of the video instead (see extract_representative_frame).
     If the timestamp is missing or out of bounds, returns an error.
     """
+    representative = request.args.get('timestamp') == REPRESENTATIVE_TIMESTAMP
     timestamp = request.args.get('timestamp', type=float)
-    if timestamp is None:
+    if timestamp is None and not representative:
         return jsonify({'error': 'Missing timestamp parameter'}), 400
+    if timestamp is not None and not math.isfinite(timestamp):
+        return jsonify({'error': 'Invalid timestamp parameter'}), 400
 
     video_id = request.args.get("video_id", None)
+    if video_id and not is_valid_video_id(video_id):
+        return jsonify({'error': f'Invalid video_id {video_id}'}), 400
     video_path = get_video_path(video_id)
     if video_id and video_path is None:
         return jsonify({'error': f'Cached video not found for video_id {video_id}'}), 404
 
+    if not representative:
+        try:
+            meta = get_video_metadata(video_path)
+        except ProbeError as exc:
+            return jsonify({'error': 'Unable to retrieve video metadata', 'message': str(exc)}), 500
+
+        if timestamp < 0 or timestamp > meta['duration']:
+            return jsonify({'error': 'Timestamp out of video duration bounds'}), 400
+        # Nearby timestamps share the same keyframe, hence the same thumbnail,
+        # which only needs to be decoded once and can then be cached by the browser.
+        timestamp = snap_to_keyframe(meta['keyframes'], timestamp)
+
+    thumbnail_format = negotiate_thumbnail_format()
+    cache_name = 'representative' if representative else f'{timestamp:.3f}'
+    # Thumbnails depend on the keyframes found in the metadata, so they are
+    # cached per METADATA_VERSION, and per version of the video file.
+    cache_path = (f"{THUMBNAIL_CACHE_DIR}/v{METADATA_VERSION}/{video_id or 'default'}/"
+                  f"{video_version(video_path)}/{cache_name}.{thumbnail_format.extension}")
+    if os.path.exists(cache_path):
+        response = send_file(cache_path, mimetype=thumbnail_format.mimetype,
+                             max_age=THUMBNAIL_MAX_AGE)
+        response.vary.add('Accept')
+        return response
+
     try:
-        meta = get_video_metadata(video_path)
+        out = run_render_thumbnail(video_path, None if representative else timestamp,
+                                   thumbnail_format)
     except ProbeError as exc:
         return jsonify({'error': 'Unable to retrieve video metadata', 'message': str(exc)}), 500
-
-    if timestamp < 0 or timestamp > meta['duration']:
+    except ThumbnailError as exc:
+        return jsonify({'error': 'Error generating thumbnail', 'details': str(exc)}), 500
+    if out is None:
+        if representative:
+            return jsonify({'error': 'Error generating thumbnail'}), 500
         return jsonify({'error': 'Timestamp out of video duration bounds'}), 400
 
     try:
-        # Use ffmpeg to seek to the timestamp and output one frame as PNG
-        out, _ = (
-            ffmpeg
-            .input(video_path, ss=timestamp)
-            .output('pipe:', vframes=1, format='image2', vcodec='png')
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-        return Response(out, mimetype='image/png')
-    except (ValueError, ffmpeg.Error) as exc:
-        return jsonify({'error': 'Error generating thumbnail', 'details': str(exc)}), 500
+        write_file_atomically(cache_path, out)
+    except OSError:
+        # The cache is only an optimization, still serve the thumbnail.
+        pass
+    else:
+        schedule_thumbnail_cache_sweep()
+    return Response(out, mimetype=thumbnail_format.mimetype,
+                    headers={'Cache-Control': f'public, max-age={THUMBNAIL_MAX_AGE}',
+                             'Vary': 'Accept'})
+
+
+@app.route('/storyboard')
+def storyboard():
+    """
+    Serves a JPEG sprite sheet of STORYBOARD_COLUMNS x STORYBOARD_ROWS
+    thumbnails evenly spread over the video, so that the page can preview any
+    timestamp without requesting a thumbnail.
+    The sprite is generated with a single ffmpeg call on the first request,
+    only decoding keyframes, and cached as
+    'static/cache/sb_{video_id}_{video_version}.jpg'.
+    """
+    video_id = request.args.get("video_id", None)
+    if video_id and not is_valid_video_id(video_id):
+        return jsonify({'error': f'Invalid video_id {video_id}'}), 400
+    video_path = get_video_path(video_id)
+    if video_id and video_path is None:
+        return jsonify({'error': f'Cached video not found for video_id {video_id}'}), 404
+
+    storyboard_path = f"static/cache/sb_{video_id or 'default'}_{video_version(video_path)}.jpg"
+    if not os.path.exists(storyboard_path):
+        try:
+            meta = get_video_metadata(video_path)
+        except ProbeError as exc:
+            return jsonify({'error': 'Unable to retrieve video metadata', 'message': str(exc)}), 500
+        if meta['duration'] <= 0:
+            return jsonify({'error': 'Unable to generate storyboard for an empty video'}), 500
+
+        tiles = STORYBOARD_COLUMNS * STORYBOARD_ROWS
+        try:
+            out = run_ffmpeg_decoding(
+                lambda input_options: ffmpeg
+                .input(video_path, skip_frame='nokey', **input_options)
+                .filter('fps', fps=tiles / meta['duration'])
+                .filter('scale', STORYBOARD_TILE_WIDTH, -2)
+                .filter('tile', f'{STORYBOARD_COLUMNS}x{STORYBOARD_ROWS}')
+                .output('pipe:', vframes=1, format='image2', vcodec='mjpeg', **{'q:v': 5})
+            )
+        except (ValueError, ffmpeg.Error) as exc:
+            return jsonify({'error': 'Error generating storyboard', 'details': str(exc)}), 500
+        if not out:
+            return jsonify({'error': 'Error generating storyboard'}), 500
+
+        try:
+            write_file_atomically(storyboard_path, out)
+        except OSError:
+            # The cache is only an optimization, still serve the storyboard.
+            return Response(out, mimetype='image/jpeg')
+
+    return send_file(storyboard_path, mimetype='image/jpeg')
 
 
 @app.route('/video')
@@ -123,12 +945,245 @@ def serve_video():
     Serves the video file.
     If a 'video_id' query parameter is provided, serves the cached video;
     otherwise, serves the default static video.
+    Honors the Range header (206 Partial Content) so that the player can seek
+    without downloading the whole file.
+    If VIDEO_ACCEL_REDIRECT is set, the transfer is offloaded to nginx.
     """
     video_id = request.args.get("video_id", None)
+    if video_id and not is_valid_video_id(video_id):
+        return jsonify({'error': f'Invalid video_id {video_id}'}), 400
     video_path = get_video_path(video_id)
     if video_id and video_path is None:
         return jsonify({'error': f'Cached video not found for video_id {video_id}'}), 404
-    return send_file(video_path, mimetype='video/mp4')
+
+    if VIDEO_ACCEL_REDIRECT:
+        # nginx serves the file itself (sendfile, Range/206 included) and the
+        # worker is released right away.
+        redirect_path = VIDEO_ACCEL_REDIRECT.rstrip('/') + '/' + os.path.relpath(video_path, 'static')
+        return Response(headers={'X-Accel-Redirect': redirect_path, 'Accept-Ranges': 'bytes'},
+                        mimetype='video/mp4')
+
+    size = os.path.getsize(video_path)
+    range_header = request.headers.get('Range')
+    if range_header is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}'})
+        if byte_range is None:
+            start, end, status = 0, size - 1, 200
+        else:
+            start, end = byte_range
+            status = 206
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Content-Length': str(end - start + 1),
+    }
+    if status == 206:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return Response(
+        stream_file(video_path, start, end), status, headers=headers, mimetype='video/mp4'
+    )
+
+
+# Runs the downloads started by /set_video in the background.
+download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+
+def download_video(youtube_url: str) -> str:
+    """
+    Downloads a YouTube video, caches it as 'static/cache/cached_{video_id}.mp4'
+    and returns its video_id.
+    Raises DownloadError if the video cannot be downloaded.
+    """
+    try:
+        with yt_dlp.YoutubeDL(YDL_OPTS) as ydl:
+            info = ydl.extract_info(youtube_url, download=True)
+    except yt_dlp.utils.YoutubeDLError as exc:
+        raise DownloadError(str(exc)) from exc
+    video_id = info.get('id')
+    if not video_id:
+        raise DownloadError('Unable to extract video id')
+    # Probe once right after download so that the metadata is stored next
+    # to the video instead of being computed on the first requests.
+    try:
+        get_video_metadata(f"{VIDEO_CACHE_DIR}/cached_{video_id}.mp4")
+    except (OSError, ProbeError):
+        pass
+    return video_id
+
+
+def _download_task_path(task_id: str) -> str:
+    """
+    Returns the path of the file storing the status of a download task.
+    """
+    return f"{DOWNLOAD_TASKS_DIR}/{task_id}.json"
+
+
+def _download_claim_path(youtube_url: str) -> str:
+    """
+    Returns the path of the file holding the task_id of the running download
+    of a URL, so that the same video is never downloaded twice at a time.
+    """
+    url_hash = hashlib.sha256(youtube_url.encode(), usedforsecurity=False).hexdigest()[:32]
+    return f"{DOWNLOAD_TASKS_DIR}/{url_hash}.url"
+
+
+def _read_download_task(task_id: str) -> tuple[dict, float] | None:
+    """
+    Returns the status of the download task as recorded in its file, along
+    with the mtime of the file, or None if the task is unknown.
+    """
+    try:
+        with open(_download_task_path(task_id), 'rb') as task_file:
+            return orjson.loads(task_file.read()), os.fstat(task_file.fileno()).st_mtime
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError) as exc:
+        return {'status': 'failed', 'details': str(exc)}, time.time()
+
+
+def _get_download_task_status(task_id: str) -> dict | None:
+    """
+    Returns the status of the download task, or None if the task is unknown.
+    A 'running' task whose file has not been touched for DOWNLOAD_TASK_STALE
+    seconds is reported as failed, as the worker running it died.
+    """
+    task = _read_download_task(task_id)
+    if task is None:
+        return None
+    status, mtime = task
+    if status['status'] == 'running' and mtime < time.time() - DOWNLOAD_TASK_STALE:
+        return {'status': 'failed', 'details': 'The download was interrupted'}
+    return status
+
+
+def _is_task_running(task_id: str) -> bool:
+    """
+    Returns whether the download task is known and still running.
+    """
+    status = _get_download_task_status(task_id)
+    return status is not None and status['status'] == 'running'
+
+
+def _claim_download(youtube_url: str, task_id: str) -> str:
+    """
+    Records task_id as the running download of the URL, unless another task
+    is already downloading it. Returns the task_id downloading the URL.
+    """
+    claim_path = _download_claim_path(youtube_url)
+    tmp_path = f"{claim_path}.{task_id}.tmp"
+    with open(tmp_path, 'w') as tmp_file:
+        tmp_file.write(task_id)
+    try:
+        # Linking fails if the claim exists, and unlike an exclusive open,
+        # never exposes a claim without its task_id.
+        for _ in range(2):
+            try:
+                os.link(tmp_path, claim_path)
+                return task_id
+            except FileExistsError:
+                pass
+            try:
+                with open(claim_path) as claim_file:
+                    claimed_task_id = claim_file.read()
+            except FileNotFoundError:
+                continue
+            if _is_task_running(claimed_task_id):
+                return claimed_task_id
+            # Claim left by a task which finished or whose worker died.
+            try:
+                os.remove(claim_path)
+            except FileNotFoundError:
+                pass
+        return task_id
+    finally:
+        os.remove(tmp_path)
+
+
+def _run_download_task(task_id: str, youtube_url: str):
+    """
+    Downloads the video and records the outcome in the status file of the task,
+    touching it every DOWNLOAD_TASK_HEARTBEAT seconds in the meantime.
+    """
+    task_path = _download_task_path(task_id)
+    finished = threading.Event()
+
+    def heartbeat():
+        while not finished.wait(DOWNLOAD_TASK_HEARTBEAT):
+            try:
+                os.utime(task_path)
+            except OSError:
+                pass
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        status = {'status': 'done', 'video_id': download_video(youtube_url)}
+    except Exception as exc:
+        # DownloadError, or any unexpected error: never leave the task 'running'.
+        status = {'status': 'failed', 'details': str(exc)}
+    finally:
+        finished.set()
+    write_file_atomically(task_path, orjson.dumps(status))
+    try:
+        os.remove(_download_claim_path(youtube_url))
+    except OSError:
+        pass
+
+
+def _sweep_download_tasks():
+    """
+    Removes the status of the tasks finished more than DOWNLOAD_TASK_RETENTION
+    seconds ago, and the claims and temporary files left behind. The tasks left
+    'running' by a dead worker are recorded as failed, and removed in turn.
+    """
+    now = time.time()
+    expiry = now - DOWNLOAD_TASK_RETENTION
+    try:
+        with os.scandir(DOWNLOAD_TASKS_DIR) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.json'):
+                        task = _read_download_task(entry.name[:-len('.json')])
+                        if task is None:
+                            continue
+                        status, mtime = task
+                        if status['status'] != 'running':
+                            if mtime < expiry:
+                                os.remove(entry.path)
+                        elif mtime < now - DOWNLOAD_TASK_STALE:
+                            write_file_atomically(entry.path, orjson.dumps(
+                                {'status': 'failed', 'details': 'The download was interrupted'}))
+                    elif entry.stat().st_mtime < expiry:
+                        if entry.name.endswith('.url'):
+                            with open(entry.path) as claim_file:
+                                if _is_task_running(claim_file.read()):
+                                    continue
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+    except FileNotFoundError:
+        pass
+
+
+def start_download(youtube_url: str) -> str:
+    """
+    Downloads a YouTube video in the background and returns the task_id to
+    poll with /set_video_status. If the URL is already being downloaded, by
+    any worker, returns the task_id of that download instead.
+    """
+    _sweep_download_tasks()
+    task_id = uuid.uuid4().hex
+    write_file_atomically(_download_task_path(task_id), orjson.dumps({'status': 'running'}))
+    claimed_task_id = _claim_download(youtube_url, task_id)
+    if claimed_task_id != task_id:
+        os.remove(_download_task_path(task_id))
+        return claimed_task_id
+    download_executor.submit(_run_download_task, task_id, youtube_url)
+    return task_id
 
 
 @app.route('/set_video', methods=['POST'])
@@ -136,27 +1191,94 @@ def set_video():
     """
     Sets the current video to a YouTube video.
     Expects a JSON payload with a 'youtube_url' field.
-    Downloads the video, caches it as 'static/cache/cached_{video_id}.mp4',
-    and returns the video_id.
+    Starts downloading the video in the background (see download_video) and
+    returns a task_id to poll with /set_video_status.
     """
     youtube_url = request.json.get("youtube_url")
     if not youtube_url:
         return jsonify({'error': 'No YouTube URL provided'}), 400
-    try:
-        # Configure yt-dlp options:
-        ydl_opts = {
-            'format': 'bestvideo+bestaudio/best',  # dynamically select best available streams
-            'merge_output_format': 'mp4',           # merge into mp4 format
-            'outtmpl': 'static/cache/cached_%(id)s.%(ext)s',
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(youtube_url, download=True)
-        video_id = info.get('id')
-        if not video_id:
-            return jsonify({'error': 'Unable to extract video id'}), 400
-        return jsonify({'message': 'Video updated successfully', 'video_id': video_id})
-    except yt_dlp.utils.YoutubeDLError as exc:
-        return jsonify({'error': 'Error downloading video', 'details': str(exc)}), 500
+    if not is_valid_youtube_url(youtube_url):
+        return jsonify({'error': 'Invalid YouTube URL'}), 400
+    return jsonify({'task_id': start_download(youtube_url)}), 202
+
+
+@app.route('/set_video/batch', methods=['POST'])
+def set_video_batch():
+    """
+    Downloads several YouTube videos in parallel in the background.
+    Expects a JSON payload with a 'youtube_urls' list of at most
+    DOWNLOAD_BATCH_MAX_URLS URLs.
+    Returns, in the same order, the task_id to poll for each URL, a URL given
+    several times being downloaded once.
+    """
+    youtube_urls = request.json.get("youtube_urls")
+    if not youtube_urls or not isinstance(youtube_urls, list):
+        return jsonify({'error': 'No YouTube URLs provided'}), 400
+    if len(youtube_urls) > DOWNLOAD_BATCH_MAX_URLS:
+        return jsonify({'error': f'At most {DOWNLOAD_BATCH_MAX_URLS} YouTube URLs can be provided'}), 400
+    invalid_urls = [youtube_url for youtube_url in youtube_urls if not is_valid_youtube_url(youtube_url)]
+    if invalid_urls:
+        return jsonify({'error': 'Invalid YouTube URLs', 'youtube_urls': invalid_urls}), 400
+    task_ids = {youtube_url: start_download(youtube_url) for youtube_url in dict.fromkeys(youtube_urls)}
+    tasks = [
+        {'youtube_url': youtube_url, 'task_id': task_ids[youtube_url]}
+        for youtube_url in youtube_urls
+    ]
+    return jsonify({'tasks': tasks}), 202
+
+
+@app.route('/set_video_status/<task_id>')
+def set_video_status(task_id: str):
+    """
+    Returns the status of a download started by /set_video:
+    'running' while downloading, then the video_id or the download error.
+    The status is read from DOWNLOAD_TASKS_DIR, so any worker can answer, and
+    is kept until swept, as several clients may poll the same download.
+    """
+    if not TASK_ID_PATTERN.fullmatch(task_id):
+        return jsonify({'error': f'Invalid task_id {task_id}'}), 400
+    status = _get_download_task_status(task_id)
+    if status is None:
+        return jsonify({'error': f'Unknown task_id {task_id}'}), 404
+    if status['status'] == 'running':
+        return jsonify({'status': 'running'})
+    if status['status'] == 'failed':
+        return jsonify({'status': 'failed', 'error': 'Error downloading video',
+                        'details': status['details']}), 500
+    return jsonify({'status': 'done', 'message': 'Video updated successfully',
+                    'video_id': status['video_id']})
+
+
+@app.after_request
+def cache_vendor_static(response: Response) -> Response:
+    """
+    Lets browsers keep the vendored assets (static/vendor/) without revalidation.
+    """
+    if request.path.startswith('/static/vendor/') and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = VENDOR_STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+@app.route('/healthz')
+def healthz():
+    """
+    Liveness endpoint for load balancers, which does not touch any video.
+    """
+    return jsonify({'status': 'ok'})
+
+
+@functools.cache
+def _render_index() -> tuple[bytes, bytes, str]:
+    """
+    Renders the index page once, as it has no variable part.
+    Returns the HTML, its gzip compressed version and its ETag.
+    """
+    html = render_template('index.html').encode('utf-8')
+    return html, gzip.compress(html, compresslevel=9), hashlib.md5(html, usedforsecurity=False).hexdigest()
+
 
 @app.route('/')
 def index():
@@ -166,198 +1288,28 @@ def index():
       - Embeds the video via the /video endpoint.
       - Displays a slider to choose a timestamp (auto-updating the thumbnail).
       - Shows video metadata in a nicely formatted Bootstrap card.
-      - On page load, initializes the slider to a random timestamp.
+      - On page load, shows a representative thumbnail of the video.
     If no YouTube video is set, the static video is used.
+    The page is served from memory, gzip compressed when the client accepts it,
+    with an ETag so that browsers can revalidate it (304 Not Modified).
     """
-    html_content = '''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-      <meta charset="UTF-8">
-      <title>Video Thumbnail and Metadata Viewer</title>
-      <!-- Bootstrap CSS -->
-      <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-      <style>
-        body { padding-top: 2rem; }
-        #thumbnail { max-width: 100%; border: 1px solid #ccc; }
-        #overlaySpinner {
-          position: fixed;
-          top: 0;
-          left: 0;
-          width: 100%;
-          height: 100%;
-          background: rgba(255,255,255,0.8);
-          z-index: 1050; /* Ensure it sits on top of other content */
-          display: flex;
-          align-items: center;
-          justify-content: center;
-        }
-      </style>
-    </head>
-    <body>
-      <div id="overlaySpinner" style="display:none;">
-        <div class="spinner-border text-primary" role="status" style="width: 4rem; height: 4rem;">
-          <span class="visually-hidden">Loading...</span>
-        </div>
-      </div>
-      <div class="container">
-        <header class="mb-4">
-          <h1 class="text-center">Video Thumbnail and Metadata Viewer</h1>
-        </header>
-        <div class="card mb-4">
-          <div class="card-header">Set YouTube Video</div>
-          <div class="card-body">
-            <div class="mb-3">
-              <label for="youtubeUrl" class="form-label">YouTube URL:</label>
-              <input type="text" class="form-control" id="youtubeUrl" placeholder="Enter YouTube URL">
-            </div>
-            <button class="btn btn-primary" onclick="setYouTubeVideo()">Set Video</button>
-            <button class="btn btn-primary" onclick="setDefaultVideo()">Default Video</button>
-            <p id="setVideoError" class="text-danger mt-2"></p>
-          </div>
-        </div>
-        <div class="row">
-          <div class="col-md-8">
-            <div class="card mb-4">
-              <div class="card-body">
-                <video id="videoPlayer" class="w-100" controls>
-                  <source src="/video" type="video/mp4">
-                  Your browser does not support the video tag.
-                </video>
-              </div>
-            </div>
-          </div>
-          <div class="col-md-4">
-            <div class="card mb-4">
-              <div class="card-header">Video Metadata</div>
-              <div class="card-body" id="metaInfo">
-                Loading metadata...
-              </div>
-            </div>
-            <div class="card mb-4">
-              <div class="card-header">Generate Thumbnail</div>
-              <div class="card-body">
-                <div class="mb-3">
-                  <label for="timestamp" class="form-label">Timestamp (seconds): <span id="timestampValue">0</span></label>
-                  <input type="range" class="form-range" id="timestamp" name="timestamp" min="0" max="100" value="0" step="0.1" oninput="updateThumbnail(this.value)">
-                </div>
-                <div class="mb-3">
-                  <img id="thumbnail" src="" alt="Thumbnail will appear here" class="img-fluid">
-                  <p id="error" class="text-danger mt-2"></p>
-                </div>
-              </div>
-            </div>
-          </div>
-          </div>
-        </div>
-      </div>
-      <!-- Bootstrap JS Bundle -->
-      <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-      <script>
-        // Global variable to keep track of the current video_id.
-        // An empty string means the default static video.
-        var currentVideoId = "";
-
-        function updateThumbnail(val) {
-          document.getElementById('timestampValue').innerText = val;
-          let url = '/thumbnail?timestamp=' + val;
-          if(currentVideoId) {
-            url += '&video_id=' + currentVideoId;
-          }
-          fetch(url)
-            .then(response => {
-              if (!response.ok) {
-                return response.json().then(err => { throw err; });
-              }
-              return response.blob();
-            })
-            .then(blob => {
-              const url = URL.createObjectURL(blob);
-              document.getElementById('thumbnail').src = url;
-              document.getElementById('error').innerText = "";
-            })
-            .catch(err => {
-              document.getElementById('error').innerText = err.error || "Error generating thumbnail";
-            });
-        }
-
-        function loadMetadata() {
-          let url = '/metadata';
-          if(currentVideoId) {
-            url += '?video_id=' + currentVideoId;
-          }
-          fetch(url)
-            .then(response => response.json())
-            .then(data => {
-              const metaInfo = `<strong>Codec:</strong> ${data.codec}<br>
-                                <strong>Resolution:</strong> ${data.width} x ${data.height}<br>
-                                <strong>Duration:</strong> ${data.duration.toFixed(2)} seconds<br>
-                                <strong>Framerate:</strong> ${data.framerate.toFixed(2)} fps`;
-              document.getElementById('metaInfo').innerHTML = metaInfo;
-              let currentTimestamp = parseFloat(document.getElementById('timestamp').value);
-              if(currentTimestamp > data.duration) {
-                  currentTimestamp = (Math.random() * data.duration).toFixed(1);
-                  document.getElementById('timestamp').value = currentTimestamp;
-                  document.getElementById('timestampValue').innerText = currentTimestamp;
-              }
-              document.getElementById('timestamp').max = data.duration;
-              updateThumbnail(document.getElementById('timestamp').value);
-            })
-            .catch(err => {
-              document.getElementById('metaInfo').innerText = "Error loading metadata";
-            });
-        }
-
-        function setYouTubeVideo() {
-          const youtubeUrl = document.getElementById('youtubeUrl').value;
-          document.getElementById('overlaySpinner').style.display = 'flex';
-          fetch('/set_video', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({ youtube_url: youtubeUrl })
-          })
-          .then(response => response.json())
-          .then(data => {
-            if(data.error) {
-              document.getElementById('setVideoError').innerText = data.error;
-            } else {
-              document.getElementById('setVideoError').innerText = "";
-              // Update the global video id and refresh the video player source.
-              currentVideoId = data.video_id;
-              document.getElementById('videoPlayer').innerHTML =
-                '<source src="/video?video_id=' + currentVideoId + '" type="video/mp4">';
-              document.getElementById('videoPlayer').load();
-              loadMetadata();
-            }
-          })
-          .catch(err => {
-            document.getElementById('setVideoError').innerText = "Error setting video";
-          })
-          .finally(() => {
-            // Hide the spinner when done
-            document.getElementById('overlaySpinner').style.display = 'none';
-          });
-        }
-
-        function setDefaultVideo() {
-          currentVideoId = '';
-          document.getElementById('videoPlayer').innerHTML = '<source src="/video" type="video/mp4">';
-          document.getElementById('videoPlayer').load();
-          document.getElementById('youtubeUrl').value = "";
-          loadMetadata();
-        }
-
-        // On page load, initialize metadata and set a random timestamp.
-        window.addEventListener('DOMContentLoaded', function() {
-          loadMetadata();
-        });
-      </script>
-    </body>
-    </html>
-    '''
-    return Response(html_content, mimetype='text/html')
+    html, html_gzip, etag = _render_index()
+    headers = {'Cache-Control': 'public, max-age=300', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip']:
+        body, etag = html_gzip, f'{etag}-gzip'
+        headers['Content-Encoding'] = 'gzip'
+    else:
+        body = html
+    response = Response(body, mimetype='text/html', headers=headers)
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 if __name__ == "__main__":
+    # The development server handles one request at a time per thread and
+    # reloads on every change: use gunicorn (see gunicorn_config.py) otherwise.
+    if not os.getenv('FLASK_DEV'):
+        sys.exit('Set FLASK_DEV=1 to run the development server, '
+                 'otherwise run: gunicorn -c gunicorn_config.py app:app')
     app.run(debug=True)
 
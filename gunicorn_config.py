@@ -0,0 +1,12 @@
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+# gevent workers handle many concurrent requests each (downloads, video streaming,
+# ffmpeg/ffprobe subprocesses), while the CPU-bound thumbnail decoding is sent
+# to a render process per worker (see THUMBNAIL_RENDER_PROCESSES in app.py).
+workers = 2 * (os.cpu_count() or 1) + 1
+worker_class = 'gevent'
+worker_connections = 1000
+raw_env = [f"THUMBNAIL_RENDER_PROCESSES={os.getenv('THUMBNAIL_RENDER_PROCESSES', '1')}"]
+# Downloads and storyboards can take a while on the first request.
+timeout = 120
@@ -0,0 +1,242 @@
+import os
+
+import av
+import pytest
+
+import app
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_dir(monkeypatch):
+    # The application uses paths relative to the repository.
+    monkeypatch.chdir(REPO_DIR)
+
+
+def probed_keyframes(video_path: str) -> list[float]:
+    """
+    Returns the keyframe timestamps of the video as listed by ffprobe,
+    which prints pts_time with 6 decimals.
+    """
+    with av.open(os.path.join(REPO_DIR, video_path)) as container:
+        stream = container.streams.video[0]
+        return sorted(
+            round(float((packet.pts - (stream.start_time or 0)) * stream.time_base), 6)
+            for packet in container.demux(stream)
+            if packet.is_keyframe and packet.pts is not None
+        )
+
+
+def test_decode_frame_returns_snapped_keyframe():
+    keyframes = probed_keyframes(app.VIDEO_PATH)
+    assert len(keyframes) > 1
+    for keyframe in keyframes:
+        for timestamp in (keyframe, keyframe + 0.1):
+            snapped = app.snap_to_keyframe(keyframes, timestamp)
+            frame = app.decode_frame(app.VIDEO_PATH, snapped)
+            assert frame is not None
+            assert frame.key_frame
+            assert frame.time == pytest.approx(snapped, abs=1e-6)
+
+
+def test_videos_metadata_probes_each_video_once(monkeypatch):
+    probed = []
+
+    async def probe_async(video_path, semaphore):
+        probed.append(video_path)
+        return {'duration': 1.0, 'keyframes': [0.0]}
+
+    def probe(video_path):
+        probed.append(video_path)
+        return {'duration': 1.0, 'keyframes': [0.0]}
+
+    monkeypatch.setattr(app, '_probe_video_metadata_async', probe_async)
+    monkeypatch.setattr(app, 'probe_video_metadata', probe)
+    # No sidecar can be written or read, e.g. static/ is read-only.
+    monkeypatch.setattr(app, '_write_metadata_sidecar', lambda *args: None)
+    monkeypatch.setattr(app, '_read_metadata_sidecar', lambda *args: None)
+    monkeypatch.setattr(app, '_metadata_cache', app.OrderedDict())
+
+    assert app.get_videos_metadata([app.VIDEO_PATH])[app.VIDEO_PATH]['duration'] == 1.0
+    assert probed == [app.VIDEO_PATH]
+    app.get_videos_metadata([app.VIDEO_PATH])
+    app.get_video_metadata(app.VIDEO_PATH)
+    assert probed == [app.VIDEO_PATH]
+
+
+@pytest.mark.parametrize('range_header', ['bytes=abc', 'bytes=5-3', 'items=0-1'])
+def test_video_ignores_invalid_range(monkeypatch, range_header):
+    monkeypatch.setattr(app, 'VIDEO_ACCEL_REDIRECT', None)
+    response = app.app.test_client().get('/video', headers={'Range': range_header})
+    assert response.status_code == 200
+    assert 'Content-Range' not in response.headers
+    assert len(response.data) == os.path.getsize(app.VIDEO_PATH)
+
+
+def test_video_rejects_range_past_end(monkeypatch):
+    monkeypatch.setattr(app, 'VIDEO_ACCEL_REDIRECT', None)
+    size = os.path.getsize(app.VIDEO_PATH)
+    response = app.app.test_client().get('/video', headers={'Range': f'bytes={size}-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{size}'
+    response = app.app.test_client().get('/video', headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    with open(app.VIDEO_PATH, 'rb') as video:
+        assert response.data == video.read(10)
+
+
+@pytest.mark.parametrize('thumbnail_format', app.THUMBNAIL_FORMATS)
+def test_encode_image_downscales(thumbnail_format):
+    image = app.Image.new('RGB', (3840, 2160))
+    encoded = app.Image.open(app.io.BytesIO(app.encode_image(image, thumbnail_format)))
+    assert encoded.size == (app.THUMBNAIL_MAX_SIZE, app.THUMBNAIL_MAX_SIZE * 9 // 16)
+
+
+def test_ffmpeg_decoding_falls_back_to_cpu(monkeypatch):
+    monkeypatch.setattr(app, 'THUMB_HWACCEL', 'cuda')
+    runs = []
+
+    class Command:
+        def __init__(self, input_options):
+            self.input_options = input_options
+
+        def run(self, **kwargs):
+            runs.append(self.input_options)
+            if self.input_options:
+                raise app.ffmpeg.Error('ffmpeg', b'', b'Device setup failed for decoder')
+            return b'image', b''
+
+    assert app.run_ffmpeg_decoding(Command) == b'image'
+    assert runs == [{'hwaccel': 'cuda'}, {}]
+
+
+def test_set_video_downloads_each_url_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'DOWNLOAD_TASKS_DIR', str(tmp_path))
+    downloaded = []
+    release = app.threading.Event()
+
+    def download_video(youtube_url):
+        downloaded.append(youtube_url)
+        release.wait(5)
+        return 'abc'
+
+    monkeypatch.setattr(app, 'download_video', download_video)
+    client = app.app.test_client()
+    url = 'https://www.youtube.com/watch?v=abc'
+    response = client.post('/set_video/batch', json={'youtube_urls': [url, url]})
+    assert response.status_code == 202
+    task_ids = {task['task_id'] for task in response.json['tasks']}
+    assert len(task_ids) == 1
+    assert client.post('/set_video', json={'youtube_url': url}).json['task_id'] in task_ids
+    release.set()
+    task_id = task_ids.pop()
+    for _ in range(50):
+        if client.get(f'/set_video_status/{task_id}').json['status'] != 'running':
+            break
+        app.time.sleep(0.1)
+    for _ in range(2):
+        # Every client sharing the download gets its result.
+        assert client.get(f'/set_video_status/{task_id}').json['video_id'] == 'abc'
+    assert downloaded == [url]
+
+
+def test_set_video_batch_is_capped():
+    urls = [f'https://youtu.be/{index}' for index in range(app.DOWNLOAD_BATCH_MAX_URLS + 1)]
+    response = app.app.test_client().post('/set_video/batch', json={'youtube_urls': urls})
+    assert response.status_code == 400
+
+
+def test_storyboard_is_served_when_it_cannot_be_cached(monkeypatch):
+    def write_file_atomically(path, data):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(app, 'get_video_metadata', lambda video_path: {'duration': 10.0})
+    monkeypatch.setattr(app, 'run_ffmpeg_decoding', lambda build: b'sprite')
+    monkeypatch.setattr(app, 'write_file_atomically', write_file_atomically)
+    response = app.app.test_client().get('/storyboard')
+    assert response.status_code == 200
+    assert response.data == b'sprite'
+
+
+def test_thumbnail_cache_follows_video_version(monkeypatch, tmp_path):
+    video_path = tmp_path / 'video.mp4'
+    monkeypatch.setattr(app, 'VIDEO_PATH', str(video_path))
+    monkeypatch.setattr(app, 'THUMBNAIL_CACHE_DIR', str(tmp_path / 'thumbs'))
+    monkeypatch.setattr(app, 'schedule_thumbnail_cache_sweep', lambda: None)
+    monkeypatch.setattr(app, 'run_render_thumbnail',
+                        lambda video_path, timestamp, thumbnail_format: open(video_path, 'rb').read())
+    client = app.app.test_client()
+    for content in (b'first video', b'replaced video'):
+        video_path.write_bytes(content)
+        for _ in range(2):
+            assert client.get('/thumbnail?timestamp=random').data == content
+
+
+@pytest.mark.parametrize('path', ['/video', '/thumbnail', '/metadata', '/storyboard'])
+def test_rejects_path_traversal_video_id(path):
+    response = app.app.test_client().get(path, query_string={'video_id': '../x', 'timestamp': 1})
+    assert response.status_code == 400
+    assert response.json['error'] == 'Invalid video_id ../x'
+
+
+def test_metadata_batch_reports_invalid_video_id():
+    response = app.app.test_client().post('/metadata/batch', json={'video_ids': ['../x']})
+    assert response.status_code == 200
+    assert response.json['videos'] == [{'video_id': '../x', 'error': 'Invalid video_id ../x'}]
+
+
+def test_set_video_rejects_other_hosts():
+    response = app.app.test_client().post('/set_video', json={'youtube_url': 'https://evil.com/x'})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('timestamp', ['nan', 'inf', '-inf'])
+def test_thumbnail_rejects_non_finite_timestamp(timestamp):
+    response = app.app.test_client().get(f'/thumbnail?timestamp={timestamp}')
+    assert response.status_code == 400
+
+
+def test_download_tasks_sweep(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'DOWNLOAD_TASKS_DIR', str(tmp_path))
+    now = app.time.time()
+    tasks = {
+        # Long download, still touched by its worker.
+        'a' * 32: ({'status': 'running'}, now),
+        # Download of a dead worker.
+        'b' * 32: ({'status': 'running'}, now - app.DOWNLOAD_TASK_STALE - 1),
+        'c' * 32: ({'status': 'done', 'video_id': 'abc'}, now - app.DOWNLOAD_TASK_RETENTION - 1),
+        'd' * 32: ({'status': 'done', 'video_id': 'abc'}, now),
+    }
+    for task_id, (status, mtime) in tasks.items():
+        task_path = app._download_task_path(task_id)
+        app.write_file_atomically(task_path, app.orjson.dumps(status))
+        os.utime(task_path, (mtime, mtime))
+
+    client = app.app.test_client()
+    assert client.get(f'/set_video_status/{"b" * 32}').json['status'] == 'failed'
+    app._sweep_download_tasks()
+    assert sorted(os.listdir(tmp_path)) == [f'{letter * 32}.json' for letter in 'abd']
+    assert client.get(f'/set_video_status/{"a" * 32}').json['status'] == 'running'
+    assert client.get(f'/set_video_status/{"b" * 32}').json['status'] == 'failed'
+    # The failure is kept for DOWNLOAD_TASK_RETENTION seconds from now on.
+    assert app._read_download_task('b' * 32)[1] > now - app.DOWNLOAD_TASK_STALE
+
+
+def test_download_task_heartbeat(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'DOWNLOAD_TASKS_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'DOWNLOAD_TASK_HEARTBEAT', 0.05)
+    task_path = app._download_task_path('a' * 32)
+    app.write_file_atomically(task_path, app.orjson.dumps({'status': 'running'}))
+    os.utime(task_path, (0, 0))
+    touched = []
+
+    def download_video(youtube_url):
+        app.time.sleep(0.5)
+        touched.append(os.stat(task_path).st_mtime)
+        return 'abc'
+
+    monkeypatch.setattr(app, 'download_video', download_video)
+    app._run_download_task('a' * 32, 'https://youtu.be/abc')
+    assert touched[0] > 0
+    assert app._get_download_task_status('a' * 32) == {'status': 'done', 'video_id': 'abc'}